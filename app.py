@@ -1,18 +1,49 @@
 # app.py
 import streamlit as st
-import yfinance as yf
 import time
 import random
 import pandas as pd
+import numpy as np
 import json
 import os
+import threading
+from importlib.util import find_spec
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tempfile import NamedTemporaryFile
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+try:
+    import orjson
+except ImportError:  # 選用加速；沒安裝時退回標準庫 json
+    orjson = None
 
 # -------------------------
 # 設定：儲存檔案名稱（持久化）
 # -------------------------
 VAULT_FILE = "investment_vault_2026.json"
 
+# 從 ticker.info（上百個欄位）中實際會用到的欄位；快取與後續計算只保留這些
+INFO_FIELDS = (
+    "symbol", "shortName", "longName",
+    "forwardPE", "trailingPE", "returnOnEquity", "revenueGrowth", "marketCap",
+)
+
+# yfinance 抓取結果的磁碟快取（跨 Streamlit 重啟 / 重新部署保留），單位：秒
+# 每次記憶體快取未命中都會先讀這層，TTL 與 get_stock_info 的 st.cache_data(ttl=300) 一致，報價才不會比 5 分鐘更舊
+INFO_CACHE_FILE = "yf_info_cache.json"
+INFO_CACHE_TTL = 300
+
+# 批次抓取時同時進行的 yfinance 請求數上限
+MAX_FETCH_WORKERS = 8
+
+# 對 Yahoo 的實際請求速率上限：平均每秒 FETCH_RATE_PER_SEC 次，最多可瞬間送出 FETCH_BURST 次
+FETCH_RATE_PER_SEC = 4
+FETCH_BURST = 8
+
+# 重試退避（秒）：指數成長並加上隨機抖動，上限 RETRY_MAX_DELAY
+RETRY_BASE_DELAY = 2
+RETRY_MAX_DELAY = 20
+
 # -------------------------
 # 檔案讀寫（原子寫入）
 # -------------------------
@@ -31,175 +62,344 @@ def load_vault():
         save_vault(data)
         return data
     try:
-        with open(VAULT_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        # 保險回退
+        return _read_json(VAULT_FILE)
+    except (OSError, ValueError):
+        # 保險回退（檔案讀不到或 JSON 損壞）
         return {"sectors": {}, "user_scores": {}}
 
 def save_vault(data):
+    payload = _dump_json(data, indent=2)
+    # 內容與檔案現況完全相同（例如手動儲存未變動的設定）時略過寫入
+    try:
+        with open(VAULT_FILE, "rb") as f:
+            if f.read() == payload:
+                return
+    except OSError:
+        pass
+    _atomic_write_bytes(VAULT_FILE, payload)
+
+def _read_json(path):
+    if orjson is not None:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _dump_json(data, indent=None) -> bytes:
+    # 有 orjson 時直接產生 UTF-8 bytes（orjson 只支援 2 格縮排）
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(data, ensure_ascii=False, indent=indent).encode("utf-8")
+
+def _atomic_write_json(path, data, indent=None):
+    _atomic_write_bytes(path, _dump_json(data, indent))
+
+def _atomic_write_bytes(path, payload: bytes):
     # 原子寫入以避免檔案損壞
-    tmp = NamedTemporaryFile("w", delete=False, encoding="utf-8", dir=".")
+    tmp = NamedTemporaryFile("wb", delete=False, dir=".")
     try:
-        json.dump(data, tmp, ensure_ascii=False, indent=2)
+        tmp.write(payload)
         tmp.flush()
         tmp.close()
-        os.replace(tmp.name, VAULT_FILE)
+        os.replace(tmp.name, path)
     finally:
         if os.path.exists(tmp.name):
             try:
                 os.remove(tmp.name)
-            except Exception:
+            except OSError:
                 pass
 
+# -------------------------
+# yfinance 結果磁碟快取
+# st.cache_data 只存在於目前的 process；這層讓重啟後仍可直接使用 INFO_CACHE_TTL 內抓過的資料
+# -------------------------
+@st.cache_resource
+def _info_cache_lock():
+    # Streamlit 每次 rerun 都會重新執行本檔，模組層級的 Lock 會被重建；
+    # 放進 cache_resource 才能讓所有 session / rerun 共用同一把鎖
+    return threading.Lock()
+
+def _load_info_cache():
+    try:
+        return _read_json(INFO_CACHE_FILE)
+    except (OSError, ValueError):
+        return {}
+
+def read_cached_info(symbol: str):
+    """回傳磁碟快取中尚未過期的 info，沒有則回傳 None。"""
+    with _info_cache_lock():
+        entry = _load_info_cache().get(symbol)
+    if entry and time.time() - entry.get("ts", 0) < INFO_CACHE_TTL:
+        return entry.get("info")
+    return None
+
+def write_cached_info(symbol: str, info: dict):
+    """寫入一筆 info，順便清掉已過期的項目，避免檔案無限成長。"""
+    now = time.time()
+    with _info_cache_lock():
+        cache = {
+            k: v for k, v in _load_info_cache().items()
+            if now - v.get("ts", 0) < INFO_CACHE_TTL
+        }
+        cache[symbol] = {"ts": now, "info": info}
+        try:
+            _atomic_write_json(INFO_CACHE_FILE, cache)
+        except (OSError, TypeError, ValueError):
+            # 快取寫入失敗不影響主流程
+            pass
+
 # -------------------------
 # yfinance 抓取（含重試、延遲、快取）
 # -------------------------
-@st.cache_data(ttl=300)
+def _backoff_delay(attempt: int) -> float:
+    """
+    第 attempt 次（從 0 起算）失敗後的等待秒數。
+    並行抓取時多檔可能同時被限流，加入抖動讓重試時間錯開，避免再次一起撞上限流。
+    """
+    return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+def _is_transient_error(e: Exception) -> bool:
+    """
+    限流、連線中斷 / 逾時、伺服器 5xx 視為暫時性錯誤，值得退避後重試；
+    其他錯誤（例如 404 無效代號、解析失敗）重試也不會成功，直接放棄。
+    """
+    # 舊版 yfinance 沒有 YFRateLimitError（或整個 exceptions 模組）；此處在例外處理中執行，
+    # 不能再丟出 ImportError，找不到時以空 tuple 代替，改由下方訊息 / 狀態碼判斷
+    import yfinance
+    rate_limit_error = getattr(getattr(yfinance, "exceptions", None), "YFRateLimitError", ())
+    if isinstance(e, rate_limit_error):
+        return True
+    err = str(e)
+    if "429" in err or "Rate limit" in err:
+        return True
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    # requests / curl_cffi 的連線與逾時例外皆為 OSError 子類；
+    # 但 JSONDecodeError、InvalidURL 等同時繼承 ValueError，屬於解析 / 參數錯誤，不重試
+    return isinstance(e, OSError) and not isinstance(e, ValueError)
+
+class TokenBucket:
+    """
+    執行緒安全的 token bucket 節流器：每秒補充 rate 個 token，最多累積 capacity 個。
+    acquire() 取得一個 token 才放行，不足時只等到下一個 token 補上為止。
+    """
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+@st.cache_resource
+def get_rate_limiter():
+    # 所有 session / rerun 共用同一個 bucket，整個 process 對 Yahoo 的速率才有上限
+    return TokenBucket(FETCH_RATE_PER_SEC, FETCH_BURST)
+
+class FetchError(Exception):
+    """
+    抓取失敗。以例外取代回傳 None：st.cache_data 不會快取例外，
+    失敗的代號下次呼叫會重新抓取，不會被記成失敗 5 分鐘。
+    reason 為需顯示給使用者的錯誤訊息（None 表示只列入失敗清單即可）。
+    """
+    def __init__(self, symbol: str, reason: str = None):
+        super().__init__(reason or symbol)
+        self.symbol = symbol
+        self.reason = reason
+
+# 記憶體快取維持 5 分鐘（只快取成功結果）；重啟後的快取交給磁碟那層（TTL 相同）。
+# max_entries 限制長時間執行時快取的筆數；進度由 batch_fetch 顯示，不另外出 spinner
+@st.cache_data(ttl=300, max_entries=512, show_spinner=False)
 def get_stock_info(symbol: str):
     """
-    嘗試抓取 ticker.info，包含簡單重試與隨機 delay。
-    回傳 dict 或 None。
+    嘗試抓取 ticker.info，僅對暫時性錯誤重試（指數退避 + 抖動）；先查磁碟快取，抓到後寫回。
+    只有真正送出網路請求前才向 token bucket 取號，快取命中不會被節流。
+    回傳只含 INFO_FIELDS 的 dict；失敗時丟出 FetchError。
+    本函式可能在背景執行緒（無 ScriptRunContext）執行，因此不直接呼叫 st.* 顯示錯誤，交由呼叫端處理。
     """
+    cached = read_cached_info(symbol)
+    if cached:
+        return cached
+    # yfinance 載入約需數百毫秒，延後到真正要連網時才 import，不拖慢首次畫面
+    import yfinance as yf
     max_retries = 3
-    base_delay = 2
     for attempt in range(max_retries):
+        last_attempt = attempt == max_retries - 1
         try:
-            time.sleep(random.uniform(0.4, 0.8))
+            get_rate_limiter().acquire()
             ticker = yf.Ticker(symbol)
             info = ticker.info or {}
             # 基本判斷：需要有 symbol 或 shortName 才算有效
             if info and (info.get("symbol") or info.get("shortName") or info.get("longName")):
+                # 只留下用得到的欄位，減少 st.cache_data 的序列化量與磁碟快取大小
+                info = {k: info[k] for k in INFO_FIELDS if k in info}
                 # 強制放入 symbol 欄位以便後續一致性
                 info["symbol"] = info.get("symbol", symbol)
+                write_cached_info(symbol, info)
                 return info
-            else:
-                # 若空，稍等並重試
-                time.sleep(base_delay * (attempt + 1))
+            # 有回應但沒有名稱 / 代號：多半是無效或已下市代號，重試也不會變，直接放棄
+            break
         except Exception as e:
-            # 若 Rate limiting，延長等待
-            err = str(e)
-            if "429" in err or "Rate limit" in err:
-                time.sleep(base_delay * (attempt + 1))
+            if _is_transient_error(e):
+                # 限流或連線問題：退避後重試
+                if not last_attempt:
+                    time.sleep(_backoff_delay(attempt))
                 continue
-            else:
-                # 不同錯誤就跳出
-                st.error(f"抓取 {symbol} 發生錯誤：{err[:200]}")
-                break
-    return None
+            # 不同錯誤就放棄，錯誤訊息交給呼叫端顯示
+            raise FetchError(symbol, f"抓取 {symbol} 發生錯誤：{str(e)[:200]}") from e
+    raise FetchError(symbol)
 
 # -------------------------
-# 批次抓取（包含進度）
+# 批次抓取（並行 + 進度）
 # -------------------------
 def batch_fetch(symbols):
+    """
+    以執行緒池並行抓取多檔 ticker.info（純網路 I/O），
+    總耗時約為最慢的一檔而非逐檔相加；進度條仍在主執行緒更新。
+    回傳 (成功的 {代號: info}, 失敗代號 list)，兩者皆維持 symbols 原順序。
+    """
     all_infos = {}
     failed = []
     total = len(symbols)
+    if total == 0:
+        return all_infos, failed
     progress = st.progress(0)
     status = st.empty()
-    for i, s in enumerate(symbols):
-        status.text(f"抓取 {s} ({i+1}/{total})...")
-        info = get_stock_info(s)
-        if info:
-            all_infos[s] = info
+    # 讓 worker 執行緒沿用目前 session 的 context，呼叫 st.cache_data 時不會出現 missing ScriptRunContext 警告
+    ctx = get_script_run_ctx()
+    results = {}
+    with ThreadPoolExecutor(
+        max_workers=min(MAX_FETCH_WORKERS, total),
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx),
+    ) as ex:
+        futures = {ex.submit(get_stock_info, s): s for s in symbols}
+        for i, fut in enumerate(as_completed(futures)):
+            s = futures[fut]
+            try:
+                results[s] = fut.result()
+            except FetchError as e:
+                # 錯誤訊息在主執行緒顯示；失敗代號統一由呼叫端列出
+                if e.reason:
+                    st.error(e.reason)
+            status.text(f"已完成 {s} ({i+1}/{total})...")
+            progress.progress((i+1)/total)
+    for s in symbols:
+        if results.get(s):
+            all_infos[s] = results[s]
         else:
             failed.append(s)
-        progress.progress((i+1)/total)
     status.empty()
     progress.empty()
     return all_infos, failed
 
+@st.cache_resource
+def _prefetch_executor():
+    # 整個 process 共用一組背景執行緒；rerun 不會重建
+    return ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS, thread_name_prefix="prefetch")
+
+def prefetch_infos(symbols):
+    """
+    選定產業後立即在背景預先抓取各檔 info（不等待結果），
+    使用者編輯評分的同時請求已在進行，按下分析時多半已是快取命中。
+    同一代號同時被預抓與正式抓取時，st.cache_data 會讓後到的呼叫等待前者結果，不會重複請求。
+    每次 rerun 都會呼叫這裡，各代號的 future 記在 session_state：已成功或仍在進行中的不重複排入佇列
+    （否則 Yahoo 變慢時重複工作會堆積，把背景執行緒全卡在同一把快取鎖上）；
+    失敗的（例外留在 future 裡，不顯示）則在下次 rerun 重新預抓。
+    """
+    futures = st.session_state.setdefault("prefetch_futures", {})
+    ex = None
+    for s in symbols:
+        fut = futures.get(s)
+        if fut is not None and (not fut.done() or fut.exception() is None):
+            continue
+        ex = ex or _prefetch_executor()
+        futures[s] = ex.submit(get_stock_info, s)
+
 # -------------------------
 # 內建簡易 "AI" 分析 (rule-based)
 # 目的：快速產生可讀的分析與綜合評分，供 UI 顯示
 # -------------------------
-def compute_combined_score(info: dict, user_score: float | None):
+# 合成分數權重，順序固定為：人工評分、PE、ROE、營收成長、市值
+# 於載入時建好一次，計分時直接做內積，不再每次重建
+SCORE_WEIGHTS = np.array([0.30, 0.20, 0.25, 0.15, 0.10])
+
+def _as_number(v):
+    """yfinance 欄位值 -> float；None / 0 / 非數值一律視為缺值 (NaN)。"""
+    if v and isinstance(v, (int, float)):
+        return float(v)
+    return np.nan
+
+def _as_user_score(v):
+    """人工評分 -> float；無法轉換者視為缺值 (NaN)。"""
+    if v is None:
+        return np.nan
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return np.nan
+
+def compute_combined_scores(infos: dict, user_scores: dict):
     """
-    根據 available metrics 計算一個 0-100 的合成分數（越高越好）。
+    一次計算整個產業每檔股票的 0-100 合成分數（越高越好），回傳 {代號: 分數}。
+    所有換算都以 NumPy 向量運算完成，不再逐檔呼叫 Python 函式。
     欄位權重（可調）：
         - user_score (人工評分): 30%
         - forwardPE: 20% (PE 低為好 -> 反向)
         - returnOnEquity: 25% (越高越好)
         - revenueGrowth: 15% (越高越好)
         - marketCap: 10% (越大代表流動性 & 大型公司穩定)
-    注意：缺值會自動降權處理。
+    注意：缺值會自動降權處理；某檔完全沒資料時回傳中性分數 50。
     """
-    # 權重
-    w_user = 0.30
-    w_pe = 0.20
-    w_roe = 0.25
-    w_rev = 0.15
-    w_mc = 0.10
-
-    # user score: 假設輸入 0-10，normalize -> 0-100
-    us = None
-    if user_score is not None:
-        try:
-            us = max(0.0, min(10.0, float(user_score))) * 10.0
-        except:
-            us = None
-
-    # forwardPE: 越小越好；我們把合理範圍 5 - 100 映射到 100 - 0
-    pe = info.get("forwardPE") or info.get("trailingPE") or None
-    pe_score = None
-    if pe and isinstance(pe, (int, float)) and pe > 0:
-        # clamp
-        p = float(pe)
-        p = max(5.0, min(200.0, p))
-        pe_score = (1.0 - (p - 5.0) / (200.0 - 5.0)) * 100.0
-
-    # ROE: 期望 0% - 60% 映射 0-100
-    roe = info.get("returnOnEquity")
-    roe_score = None
-    if roe and isinstance(roe, (int, float)):
-        r = max(-0.5, min(0.6, float(roe)))  # -50% .. 60%
-        roe_score = ((r - (-0.5)) / (1.1)) * 100.0  # normalize
-
-    # revenueGrowth: -1 .. 2 (即 -100% 到 +200%) 映射 0-100
-    rg = info.get("revenueGrowth")
-    rg_score = None
-    if rg and isinstance(rg, (int, float)):
-        g = max(-1.0, min(2.0, float(rg)))
-        rg_score = ((g + 1.0) / 3.0) * 100.0
-
-    # marketCap: map log-scale to 0-100
-    mc = info.get("marketCap")
-    mc_score = None
-    if mc and isinstance(mc, (int, float)) and mc > 0:
-        import math
-        # 使用 log10 市值，並對常見範圍 1e7 to 1e12 做映射
-        v = math.log10(mc)
-        v = max(7.0, min(12.0, v))
-        mc_score = ((v - 7.0) / 5.0) * 100.0
-
-    # 合併：若某項為 None，則對應權重降為 0，並把其他權重重新 normalize
-    parts = []
-    weights = []
-    if us is not None:
-        parts.append(us * w_user)
-        weights.append(w_user)
-    if pe_score is not None:
-        parts.append(pe_score * w_pe)
-        weights.append(w_pe)
-    if roe_score is not None:
-        parts.append(roe_score * w_roe)
-        weights.append(w_roe)
-    if rg_score is not None:
-        parts.append(rg_score * w_rev)
-        weights.append(w_rev)
-    if mc_score is not None:
-        parts.append(mc_score * w_mc)
-        weights.append(w_mc)
-
-    if not weights:
-        return 50.0  # 完全沒資料時回傳中性分數
-
-    # normalize by sum(weights)
-    sum_w = sum(weights)
-    combined = sum(parts) / sum_w
+    symbols = list(infos.keys())
+    if not symbols:
+        return {}
+
+    # 原始數值矩陣：每列一檔股票，缺值為 NaN
+    us = np.array([_as_user_score(user_scores.get(s)) for s in symbols])
+    pe = np.array([_as_number(infos[s].get("forwardPE") or infos[s].get("trailingPE")) for s in symbols])
+    roe = np.array([_as_number(infos[s].get("returnOnEquity")) for s in symbols])
+    rg = np.array([_as_number(infos[s].get("revenueGrowth")) for s in symbols])
+    mc = np.array([_as_number(infos[s].get("marketCap")) for s in symbols])
+
+    # 非正值的 PE / 市值視為缺值
+    pe[pe <= 0] = np.nan
+    mc[mc <= 0] = np.nan
+
+    # 欄位順序需與 SCORE_WEIGHTS 一致
+    scores = np.column_stack([
+        # user score: 假設輸入 0-10，normalize -> 0-100
+        np.clip(us, 0.0, 10.0) * 10.0,
+        # forwardPE: 越小越好；把 5 - 200 映射到 100 - 0
+        (1.0 - (np.clip(pe, 5.0, 200.0) - 5.0) / (200.0 - 5.0)) * 100.0,
+        # ROE: -50% .. 60% 映射 0-100
+        ((np.clip(roe, -0.5, 0.6) + 0.5) / 1.1) * 100.0,
+        # revenueGrowth: -1 .. 2 (即 -100% 到 +200%) 映射 0-100
+        ((np.clip(rg, -1.0, 2.0) + 1.0) / 3.0) * 100.0,
+        # marketCap: log10 市值，對常見範圍 1e7 to 1e12 做映射
+        ((np.clip(np.log10(mc), 7.0, 12.0) - 7.0) / 5.0) * 100.0,
+    ])
+
+    # 合併：缺值的項目權重降為 0，並把其他權重重新 normalize
+    present = ~np.isnan(scores)
+    sum_w = present @ SCORE_WEIGHTS
+    weighted = np.where(present, scores, 0.0) @ SCORE_WEIGHTS
+    with np.errstate(invalid="ignore", divide="ignore"):
+        combined = np.where(sum_w > 0, weighted / sum_w, 50.0)
     # clamp 0-100
-    combined = max(0.0, min(100.0, combined))
-    return round(combined, 2)
+    combined = np.clip(combined, 0.0, 100.0)
+    return {s: round(float(c), 2) for s, c in zip(symbols, combined)}
 
 def generate_text_summary(info: dict, user_score):
     """
@@ -275,7 +475,7 @@ def display_sector_ui(vault):
                 save_vault(vault)
                 st.sidebar.success(f"已新增產業：{new_name}")
                 # refresh (簡單方式)
-                st.experimental_rerun()
+                st.rerun()
         st.sidebar.markdown("---")
         selected_sector = None
 
@@ -300,7 +500,7 @@ def display_sector_ui(vault):
                 vault["sectors"] = sectors
                 save_vault(vault)
                 st.sidebar.success("已新增並儲存。")
-                st.experimental_rerun()
+                st.rerun()
 
         # 刪除某個 ticker
         del_ticker = st.sidebar.selectbox("選擇要移除的股票", options=["-- 不移除 --"] + stocks)
@@ -311,7 +511,7 @@ def display_sector_ui(vault):
                 vault["sectors"] = sectors
                 save_vault(vault)
                 st.sidebar.success(f"已移除 {del_ticker}")
-                st.experimental_rerun()
+                st.rerun()
 
         st.sidebar.markdown("---")
         # 允許重命名或刪除產業
@@ -322,7 +522,7 @@ def display_sector_ui(vault):
                 vault["sectors"] = sectors
                 save_vault(vault)
                 st.sidebar.success(f"已刪除產業 {selected_sector}")
-                st.experimental_rerun()
+                st.rerun()
 
     # 提供整體儲存/匯出按鈕
     st.sidebar.markdown("---")
@@ -335,24 +535,17 @@ def display_sector_ui(vault):
 
     return vault
 
-def display_main_area(vault):
-    st.title("📈 股票產業分析工具（已加入持久化與內建分析）")
-    st.caption("資料來源主要來自 yfinance；你也可手動輸入個股分數，系統會把 yfinance 與你輸入的分數合併後產生分析與排序。")
-
-    sectors = vault.get("sectors", {})
-    user_scores = vault.get("user_scores", {})
-
-    # 預設選產業
-    if not sectors:
-        st.warning("目前沒有任何產業，請在側邊欄新增產業與股票。")
-        return
-
-    selected_sector = st.selectbox("選擇要分析的產業", options=list(sectors.keys()))
-    tickers = sectors.get(selected_sector, [])
-    st.info(f"此產業將分析 {len(tickers)} 檔股票：{', '.join(tickers)}")
-
-    # 使用者可一次自訂多檔的手動分數（表格輸入）
+@st.fragment
+def score_editor_panel(vault, tickers, user_scores):
+    """
+    人工評分編輯區。包成 fragment：輸入文字與驗證失敗只重跑這一區；
+    成功儲存 / 清除後改為整頁重跑，讓已顯示的比較表（人工評分、合成分數與排序）一併清掉，
+    不會留下過期結果。重跑前把提示訊息暫存在 session_state，重跑後再顯示。
+    """
     st.subheader("🔧 手動輸入 / 編輯 你的評分 (0-10)")
+    flash = st.session_state.pop("score_flash", None)
+    if flash:
+        st.success(flash)
     if tickers:
         cols = st.columns([2, 1, 1])
         with cols[0]:
@@ -373,109 +566,131 @@ def display_main_area(vault):
                 if st.button(f"保存_{s}", key=f"save_{s}"):
                     # 驗證並存檔
                     try:
-                        if new_val == "":
-                            # 若空字串視為清除
-                            if s in user_scores:
-                                user_scores.pop(s, None)
+                        num = float(new_val) if new_val != "" else None
+                        if num is not None and (num < 0 or num > 10):
+                            # 超出範圍不存檔，只顯示錯誤
+                            st.error("評分請介於 0-10。")
                         else:
-                            num = float(new_val)
-                            if num < 0 or num > 10:
-                                st.error("評分請介於 0-10。")
+                            if num is None:
+                                # 若空字串視為清除
+                                user_scores.pop(s, None)
                             else:
                                 user_scores[s] = round(num, 2)
-                        vault["user_scores"] = user_scores
-                        save_vault(vault)
-                        st.success(f"{s} 的分數已儲存。")
-                    except Exception as e:
+                            vault["user_scores"] = user_scores
+                            save_vault(vault)
+                            st.session_state["score_flash"] = f"{s} 的分數已儲存。"
+                            st.rerun(scope="app")
+                    except (ValueError, OSError) as e:
+                        # ValueError：輸入不是數字；OSError：寫檔失敗
                         st.error(f"儲存失敗：{e}")
-                    st.experimental_rerun()
                 if st.button(f"清除_{s}", key=f"clear_{s}"):
                     if s in user_scores:
                         user_scores.pop(s, None)
                         vault["user_scores"] = user_scores
                         save_vault(vault)
-                        st.success(f"{s} 的分數已清除。")
+                        st.session_state["score_flash"] = f"{s} 的分數已清除。"
+                        st.rerun(scope="app")
                     else:
                         st.info("原本就沒有分數。")
-                    st.experimental_rerun()
 
-    st.markdown("---")
-    # 分析按鈕
+@st.fragment
+def analysis_panel(tickers, user_scores):
+    """
+    分析按鈕與比較表。包成 fragment：按下分析只重跑這一區，
+    不會連帶重繪側邊欄與評分編輯區。評分成功儲存 / 清除會整頁重跑並清掉此區結果，需重新分析。
+    """
     if st.button("🚀 開始分析（抓取 yfinance + 產生內建分析）"):
         with st.spinner("抓取資料並運算中..."):
             infos, failed = batch_fetch(tickers)
             if failed:
                 st.warning(f"下列代號抓取失敗：{', '.join(failed)}（可能無效代號或被限流）")
 
-            # 整理 table
-            records = []
-            for t in tickers:
-                info = infos.get(t, {}) if infos else {}
-                rec = {
-                    "公司名稱": info.get("shortName", info.get("longName", "N/A")),
-                    "代號": t,
-                    "前瞻 PE": round(info.get("forwardPE", 0), 2) if info.get("forwardPE") else ("N/A" if info.get("trailingPE") is None else round(info.get("trailingPE"),2)),
-                    "ROE %": f"{info.get('returnOnEquity', None)*100:.2f}%" if info.get('returnOnEquity') is not None else "N/A",
-                    "營收增長 %": f"{info.get('revenueGrowth', None)*100:.2f}%" if info.get('revenueGrowth') is not None else "N/A",
-                    "市值 (B)": f"${info.get('marketCap', 0)/1e9:.2f}B" if info.get('marketCap') else "N/A",
-                    "人工評分": user_scores.get(t, "N/A"),
-                }
-                # 計算合成分數與分析文字
-                combined = compute_combined_score(info, user_scores.get(t, None))
-                summary = generate_text_summary(info, user_scores.get(t, None))
-                rec["合成分數 (0-100)"] = combined
-                rec["分析摘要（點擊右側展開看詳細）」] = "查看"
-                records.append((t, rec, summary, info))
-
-            # 將 records 轉為 DataFrame（以合成分數排序）
-            df_rows = [r for (_, r, _, _) in records]
-            df = pd.DataFrame(df_rows)
-            try:
-                df_sorted = df.sort_values("合成分數 (0-100)", ascending=False)
-            except:
-                df_sorted = df
+            # 整理 table：抓取失敗的代號已列在上方警告，不放進比較表以免出現誤導的分數
+            symbols = [t for t in tickers if infos.get(t)]
+            rows = [infos[t] for t in symbols]
+            combined_scores = compute_combined_scores(infos, user_scores)
+            names = [i.get("shortName", i.get("longName", "N/A")) for i in rows]
+            summaries = [generate_text_summary(i, user_scores.get(t, None)) for t, i in zip(symbols, rows)]
+
+            # 直接以欄為單位建 DataFrame（以合成分數排序），不逐列組 dict
+            # 數值欄維持數字（缺值為 NaN），顯示格式交給 column_config 一次處理，排序才會依數值而非字串
+            df = pd.DataFrame({
+                "公司名稱": names,
+                "代號": symbols,
+                "前瞻 PE": [i.get("forwardPE") or i.get("trailingPE") for i in rows],
+                "ROE %": [i["returnOnEquity"]*100 if i.get("returnOnEquity") is not None else None for i in rows],
+                "營收增長 %": [i["revenueGrowth"]*100 if i.get("revenueGrowth") is not None else None for i in rows],
+                "市值 (B)": [i["marketCap"]/1e9 if i.get("marketCap") else None for i in rows],
+                "人工評分": [user_scores.get(t, np.nan) for t in symbols],
+                "合成分數 (0-100)": [combined_scores[t] for t in symbols],
+                "分析摘要（點擊右側展開看詳細）": "查看",
+            })
+            df_sorted = df.sort_values("合成分數 (0-100)", ascending=False)
             st.subheader("📋 同業比較表（依合成分數排序）")
-            st.dataframe(df_sorted.reset_index(drop=True), use_container_width=True)
+            st.dataframe(
+                df_sorted.reset_index(drop=True),
+                use_container_width=True,
+                column_config={
+                    "前瞻 PE": st.column_config.NumberColumn(format="%.2f"),
+                    "ROE %": st.column_config.NumberColumn(format="%.2f%%"),
+                    "營收增長 %": st.column_config.NumberColumn(format="%.2f%%"),
+                    "市值 (B)": st.column_config.NumberColumn(format="$%.2fB"),
+                },
+            )
 
             # 顯示每檔的文字摘要與來源
             st.subheader("🔎 各檔股票詳細說明（來源標示）")
-            for (t, rec, summary, info) in records:
-                with st.expander(f"{t} — {rec['公司名稱']}，合成分數：{rec['合成分數 (0-100)']}"):
+            for t, name, summary, info in zip(symbols, names, summaries, rows):
+                with st.expander(f"{t} — {name}，合成分數：{combined_scores[t]}"):
                     st.markdown(summary)
                     st.markdown("**來源說明（此處列出此檔股票資訊的來源）**")
                     # 判斷哪些欄位存在且來源為 yfinance；人工評分來源於 user
-                    src_lines = []
-                    # 主要欄位
-                    if info:
-                        src_lines.append("- yfinance: shortName/longName, forwardPE/trailingPE, returnOnEquity, revenueGrowth, marketCap 等欄位。")
-                    else:
-                        src_lines.append("- 無 yfinance 資料（抓取失敗或代號錯誤）。")
+                    # 主要欄位（抓取失敗的代號已在上方排除，這裡的 info 必定有值）
+                    src_lines = ["- yfinance: shortName/longName, forwardPE/trailingPE, returnOnEquity, revenueGrowth, marketCap 等欄位。"]
                     if user_scores.get(t) is not None:
                         src_lines.append("- 你的人工評分：直接由你在 UI 輸入並儲存在本地 JSON。")
                     st.markdown("\n".join(src_lines))
                     # 顯示 raw info 的重點欄位（條列式）
                     st.markdown("**條列式重點數據**")
-                    bullet = []
-                    if info:
-                        bullet.append(f"- 公司名稱：{info.get('shortName') or info.get('longName')}")
-                        if info.get("forwardPE") or info.get("trailingPE"):
-                            pe_val = info.get("forwardPE") or info.get("trailingPE")
-                            bullet.append(f"- PE：{pe_val}")
-                        if info.get("returnOnEquity") is not None:
-                            bullet.append(f"- ROE：{info.get('returnOnEquity')*100:.2f}%")
-                        if info.get("revenueGrowth") is not None:
-                            bullet.append(f"- 營收成長率：{info.get('revenueGrowth')*100:.2f}%")
-                        if info.get("marketCap") is not None:
-                            bullet.append(f"- 市值：${info.get('marketCap')/1e9:.2f}B")
-                    else:
-                        bullet.append("- 無可用細項數據（yfinance 抓取失敗）。")
+                    bullet = [f"- 公司名稱：{info.get('shortName') or info.get('longName')}"]
+                    if info.get("forwardPE") or info.get("trailingPE"):
+                        pe_val = info.get("forwardPE") or info.get("trailingPE")
+                        bullet.append(f"- PE：{pe_val}")
+                    if info.get("returnOnEquity") is not None:
+                        bullet.append(f"- ROE：{info.get('returnOnEquity')*100:.2f}%")
+                    if info.get("revenueGrowth") is not None:
+                        bullet.append(f"- 營收成長率：{info.get('revenueGrowth')*100:.2f}%")
+                    if info.get("marketCap") is not None:
+                        bullet.append(f"- 市值：${info.get('marketCap')/1e9:.2f}B")
                     st.markdown("\n".join(bullet))
 
-            # 儲存最新 vault（把 user_scores 與 sectors 寫回檔案）
-            vault["user_scores"] = user_scores
-            vault["sectors"] = sectors
-            save_vault(vault)
-            st.success("分析完成，結果已顯示並且本地已儲存你的人工評分。")
+            # 人工評分與產業在各自的按鈕中已即時寫回檔案，分析流程本身不改動 vault，不需再整份重寫
+            st.success("分析完成，結果已顯示（你的人工評分已於儲存時寫入本地）。")
+
+def display_main_area(vault):
+    st.title("📈 股票產業分析工具（已加入持久化與內建分析）")
+    st.caption("資料來源主要來自 yfinance；你也可手動輸入個股分數，系統會把 yfinance 與你輸入的分數合併後產生分析與排序。")
+
+    sectors = vault.get("sectors", {})
+    user_scores = vault.get("user_scores", {})
+
+    # 預設選產業
+    if not sectors:
+        st.warning("目前沒有任何產業，請在側邊欄新增產業與股票。")
+        return
+
+    selected_sector = st.selectbox("選擇要分析的產業", options=list(sectors.keys()))
+    # 手動編輯過的 vault 可能含重複代號；保留順序去重，避免重複抓取、重複列與評分 widget key 衝突
+    tickers = list(dict.fromkeys(sectors.get(selected_sector, [])))
+    st.info(f"此產業將分析 {len(tickers)} 檔股票：{', '.join(tickers)}")
+    prefetch_infos(tickers)
+
+    # 使用者可一次自訂多檔的手動分數（表格輸入）
+    score_editor_panel(vault, tickers, user_scores)
+
+    st.markdown("---")
+    # 分析按鈕與結果
+    analysis_panel(tickers, user_scores)
 
     # 使用說明
     with st.expander("📖 使用說明與備註"):
@@ -491,6 +706,10 @@ def display_main_area(vault):
 # -------------------------
 def main():
     st.set_page_config(page_title="股票產業分析", page_icon="📈", layout="wide")
+    # yfinance 延後到抓取時才 import；啟動時先確認已安裝，避免缺套件時到分析途中才爆出 traceback
+    if find_spec("yfinance") is None:
+        st.error("找不到 yfinance 套件，請先執行 `pip install -r requirements.txt`。")
+        st.stop()
     # load
     vault = load_vault()
     vault = display_sector_ui(vault)
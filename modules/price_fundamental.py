@@ -1,15 +1,20 @@
 import yfinance as yf
-import pandas as pd
 
-def get_price(symbol):
-    info = yf.Ticker(symbol).info
+def get_info(symbol):
+    # 單次抓取 ticker.info；同一檔要同時取價格與基本面時先呼叫這裡，再把結果傳給下面兩個函式
+    return yf.Ticker(symbol).info
+
+def get_price(symbol, info=None):
+    if info is None:
+        info = get_info(symbol)
     return {
         "price": info.get("currentPrice"),
         "change": info.get("regularMarketChangePercent")
     }
 
-def get_fundamentals(symbol):
-    info = yf.Ticker(symbol).info
+def get_fundamentals(symbol, info=None):
+    if info is None:
+        info = get_info(symbol)
     data = {
         "股價": info.get("currentPrice"),
         "PE": info.get("trailingPE"),
@@ -19,4 +24,5 @@ def get_fundamentals(symbol):
         "市值": info.get("marketCap"),
         "FCF": info.get("freeCashflow")
     }
-    return pd.DataFrame(data.items(), columns=["指標", "數值"])
+    # 直接回傳 {指標: 數值}；需要表格顯示時再於呼叫端轉成 DataFrame
+    return data